@@ -6,6 +6,7 @@ import subprocess
 import time
 
 import i18n
+import numpy as np
 
 from btb_manager_telegram import BOUGHT, BUYING, SELLING, SOLD, settings
 from btb_manager_telegram.binance_api_utils import get_current_price
@@ -79,21 +80,24 @@ def current_value(cur):
     last_update = dt.datetime.strptime(last_update, "%Y-%m-%d %H:%M:%S.%f")
 
     reports = get_previous_reports()
-    reports.reverse()
+    btc_tickers = reports.tickers.get("BTC", np.full(len(reports), np.nan))
 
     days_deltas = [1, 7, 30]
     return_rates = []
     amount_btc_now = balance * btc_price
     ts_now = int(last_update.timestamp())
     delta = days_deltas[0]
-    for report in reports:
-        if ts_now - report["time"] > dt.timedelta(days=delta).total_seconds():
+    for i_report in range(len(reports) - 1, -1, -1):
+        report_time = int(reports.time[i_report])
+        report_total_usdt = reports.total_usdt[i_report]
+        if ts_now - report_time > dt.timedelta(days=delta).total_seconds():
             if (
-                ts_now - report["time"] - dt.timedelta(days=delta).total_seconds()
+                ts_now - report_time - dt.timedelta(days=delta).total_seconds()
                 < dt.timedelta(hours=2).total_seconds()
-                and report["total_usdt"] > 0
+                and report_total_usdt > 0
+                and btc_tickers[i_report] > 0
             ):
-                amount_btc_old = report["total_usdt"] / report["tickers"]["BTC"]
+                amount_btc_old = report_total_usdt / btc_tickers[i_report]
                 rate = (amount_btc_now - amount_btc_old) / amount_btc_old
                 rate_str = "+" if rate >= 0 else ""
                 rate_str += str(round(rate * 100, 2))
@@ -381,7 +385,10 @@ def bot_stats(cur):
     end_date = dt.datetime.strptime(bot_end_date[2:], "%y-%m-%d %H:%M:%S.%f")
     numDays = (end_date - start_date).days
 
-    reports = [r for r in get_previous_reports() if r["time"] >= start_date.timestamp()]
+    reports = get_previous_reports()
+    start = reports.start_index(start_date.timestamp())
+    reports_total_usdt = reports.total_usdt[start:]
+    reports_btc_tickers = reports.tickers["BTC"][start:]
 
     # get first trade and its bridge - all stats must be in this bridge
     cur.execute(
@@ -443,11 +450,11 @@ def bot_stats(cur):
         (convertibleStartCoinAmount - initialCoinAmount) / initialCoinAmount * 100
     )
 
-    max_usd = max(reports, key=lambda a: a["total_usdt"])["total_usdt"]
-    min_usd = min(reports, key=lambda a: a["total_usdt"])["total_usdt"]
-    btc_vals = [a["total_usdt"] / a["tickers"]["BTC"] for a in reports]
-    max_btc = max(btc_vals)
-    min_btc = min(btc_vals)
+    max_usd = float(reports_total_usdt.max())
+    min_usd = float(reports_total_usdt.min())
+    btc_vals = reports_total_usdt / reports_btc_tickers
+    max_btc = float(np.nanmax(btc_vals))
+    min_btc = float(np.nanmin(btc_vals))
 
     message += (
         "`"
@@ -1,3 +1,5 @@
+import re
+
 import telegram
 
 
@@ -5,18 +7,25 @@ def format_float(num):
     return f"{num:0.8f}".rstrip("0").rstrip(".")
 
 
+def _escape_tg_pattern(escape_char):
+    # an already escaped character is matched with its backslash
+    # so that it is left as it is
+    return re.compile(r"\\.|[" + re.escape("".join(escape_char)) + "]", re.DOTALL)
+
+
+def _escape_tg_match(match):
+    char = match.group()
+    return char if char[0] == "\\" else "\\" + char
+
+
+_escape_char = [".", "-", "?", "!", ">", "{", "}", "=", "+", "|"]
+_escape_tg_re = _escape_tg_pattern(_escape_char)
+_escape_tg_re_parenthesis = _escape_tg_pattern(_escape_char + ["(", ")", "[", "]"])
+
+
 def escape_tg(message, exclude_parenthesis=False):
-    escape_char = [".", "-", "?", "!", ">", "{", "}", "=", "+", "|"]
-    if exclude_parenthesis:
-        escape_char += ["(", ")", "[", "]"]
-    escaped_message = ""
-    is_escaped = False
-    for cur_char in message:
-        if cur_char in escape_char and not is_escaped:
-            escaped_message += "\\"
-        escaped_message += cur_char
-        is_escaped = cur_char == "\\" and not is_escaped
-    return escaped_message
+    escape_re = _escape_tg_re_parenthesis if exclude_parenthesis else _escape_tg_re
+    return escape_re.sub(_escape_tg_match, message)
 
 
 def reply_text_escape(reply_text_fun):
@@ -27,17 +36,19 @@ def reply_text_escape(reply_text_fun):
 
 
 def telegram_text_truncator(m_list, padding_chars_head="", padding_chars_tail=""):
-    message = [padding_chars_head]
-    index = 0
+    max_length = telegram.constants.MAX_MESSAGE_LENGTH - len(padding_chars_tail)
+    messages = []
+    chunks = [padding_chars_head]
+    length = len(padding_chars_head)
     for mes in m_list:
-        if (
-            len(message[index]) + len(mes) + len(padding_chars_tail)
-            <= telegram.constants.MAX_MESSAGE_LENGTH
-        ):
-            message[index] += mes
+        if length + len(mes) <= max_length:
+            chunks.append(mes)
+            length += len(mes)
         else:
-            message[index] += padding_chars_tail
-            message.append(padding_chars_head + mes)
-            index += 1
-    message[index] += padding_chars_tail
-    return message
+            chunks.append(padding_chars_tail)
+            messages.append("".join(chunks))
+            chunks = [padding_chars_head, mes]
+            length = len(padding_chars_head) + len(mes)
+    chunks.append(padding_chars_tail)
+    messages.append("".join(chunks))
+    return messages
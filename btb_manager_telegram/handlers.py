@@ -44,6 +44,7 @@ from btb_manager_telegram.utils import (
     find_and_kill_binance_trade_bot_process,
     get_custom_scripts_keyboard,
     get_restart_file_name,
+    is_btb_bot_update_available,
     kill_btb_manager_telegram_process,
 )
 
@@ -523,6 +524,7 @@ def update_btb(update, _):
                 shell=True,
             )
             settings.BTB_UPDATE_BROADCASTED_BEFORE = False
+            is_btb_bot_update_available.cache_clear()
         except Exception as e:
             logger.error(f"Unable to update Binance Trade Bot: {e}", exc_info=True)
             message = "Unable to update Binance Trade Bot"
@@ -711,7 +713,7 @@ def create_graph(update, _):
     input_text_filtered = f"{','.join(coins)} {days}"
 
     try:
-        figname, nb_plot = get_graph(False, coins, days, "amount", "USD")
+        figure, nb_plot = get_graph(False, coins, days, "amount", "USD")
     except Exception as e:
         message = f"{i18n.t('graph.error')}\n ```\n"
         message += "".join(traceback.format_exception(*sys.exc_info()))
@@ -744,10 +746,9 @@ def create_graph(update, _):
         favourite_graphs.append([input_text_filtered, 1])
     np.save("data/favourite_graphs.npy", favourite_graphs, allow_pickle=True)
 
-    with open(figname, "rb") as f:
-        update.message.reply_photo(
-            f, reply_markup=keyboards.menu, parse_mode="MarkdownV2"
-        )
+    update.message.reply_photo(
+        figure, reply_markup=keyboards.menu, parse_mode="MarkdownV2"
+    )
 
     return MENU
 
@@ -1,15 +1,16 @@
-import datetime as dt
+import copy
+import io
+import json
 import os
 import shutil
 import sys
+import threading
 import time
 import traceback
 import warnings
+from concurrent.futures import ThreadPoolExecutor
 
-import binance
 import i18n
-import matplotlib.dates as mdates
-import matplotlib.pyplot as plt
 import numpy as np
 import requests
 
@@ -23,18 +24,309 @@ warnings.filterwarnings("ignore", category=UserWarning)
 additional_coins = ["BTC"]
 include_only_coinlist = True
 
+_reports_cache = {"mtime": None, "reports": None}
+_oer_session = requests.Session()
+
+fx_cache_ttl = 6 * 60 * 60
+_fx_cache = {"time": 0, "rate": None, "currency": None}
+
+_figures = {}
+_figures_lock = threading.Lock()
+
 
 def reports_path():
+    return os.path.join(settings.ROOT_PATH, "data", "btbmt_reports")
+
+
+def legacy_reports_path():
     return os.path.join(settings.ROOT_PATH, "data", "btbmt_reports.npy")
 
 
+class SymbolMatrix:
+    """
+    Values of a report field for every symbol, as a 2-D array of shape
+    (number of reports, number of symbols) with NaN for missing values.
+    `symbol_index` maps each symbol to its column, and indexing the matrix
+    with a symbol returns that column.
+    A matrix is never modified once created : adding symbols or rows returns
+    a new matrix, so that readers in other threads always see consistent
+    values.
+    """
+
+    def __init__(self, symbols=(), values=None, length=0, dtype=np.float64):
+        self.symbol_index = {symbol: i for i, symbol in enumerate(symbols)}
+        self.dtype = np.dtype(dtype)
+        if values is None:
+            values = np.full((length, len(self.symbol_index)), np.nan, self.dtype)
+        self._buffer = values
+        self._length = len(values)
+        # number of rows of the buffer used by its latest matrix, shared by
+        # all the matrices using this buffer
+        self._buffer_used = [self._length]
+
+    @property
+    def symbols(self):
+        return list(self.symbol_index)
+
+    @property
+    def values(self):
+        return self._buffer[: self._length]
+
+    def __contains__(self, symbol):
+        return symbol in self.symbol_index
+
+    def __iter__(self):
+        return iter(self.symbol_index)
+
+    def __getitem__(self, symbol):
+        return self.values[:, self.symbol_index[symbol]]
+
+    def get(self, symbol, default=None):
+        if symbol in self.symbol_index:
+            return self[symbol]
+        return default
+
+    def with_symbols(self, symbols):
+        """
+        Matrix with a NaN column added for each symbol not in this matrix,
+        and the list of these new symbols
+        """
+        new_symbols = [s for s in symbols if s not in self.symbol_index]
+        if len(new_symbols) == 0:
+            return self, new_symbols
+        padding = np.full((self._length, len(new_symbols)), np.nan, self.dtype)
+        values = np.concatenate((self.values, padding), axis=1)
+        return (
+            SymbolMatrix(self.symbols + new_symbols, values, dtype=self.dtype),
+            new_symbols,
+        )
+
+    def with_rows(self, rows):
+        """
+        Matrix with `rows` appended. The rows are written after the end of
+        this matrix in the buffer, which it never reads, so the buffer is
+        shared when this matrix is its latest user and it has room left.
+        """
+        length = self._length + len(rows)
+        buffer, buffer_used = self._buffer, self._buffer_used
+        if self._length != buffer_used[0] or length > len(buffer):
+            # grow by doubling to keep appends amortized O(1)
+            buffer = np.full(
+                (max(length, 2 * self._length), len(self.symbol_index)),
+                np.nan,
+                self.dtype,
+            )
+            buffer[: self._length] = self.values
+            buffer_used = [self._length]
+        buffer[self._length : length] = rows
+        buffer_used[0] = length
+
+        matrix = copy.copy(self)
+        matrix._buffer = buffer
+        matrix._length = length
+        matrix._buffer_used = buffer_used
+        return matrix
+
+
+class ReportStore:
+    """
+    Append-only columnar storage of the reports.
+    `time` and `total_usdt` hold one value per report, each in a raw binary
+    file inside the store directory. `tickers` and `balances` are
+    `SymbolMatrix`, stored as a raw row-major binary file along with a
+    json file listing the symbol of each column. The name of the binary
+    file holds the number of columns, so that a matrix is never read with
+    the column count of another version of the json file.
+    """
+
+    # the tickers have at most 8 significant digits, float32 is enough for
+    # the graphs. The balances are 8-decimal quantities and are kept exact.
+    groups = {"tickers": np.float32, "balances": np.float64}
+
+    def __init__(self, path):
+        self.path = path
+        self.time = np.empty(0, dtype=np.int64)
+        self.total_usdt = np.empty(0, dtype=np.float64)
+        self.tickers = SymbolMatrix(dtype=self.groups["tickers"])
+        self.balances = SymbolMatrix(dtype=self.groups["balances"])
+
+    def __len__(self):
+        return len(self.time)
+
+    def _column_path(self, name):
+        return os.path.join(self.path, name) + ".bin"
+
+    def _symbols_path(self, group):
+        return os.path.join(self.path, group) + ".json"
+
+    @staticmethod
+    def _matrix_name(group, width):
+        return f"{group}.{width}"
+
+    def _read_column(self, name, dtype, length=None, width=None):
+        path = self._column_path(name)
+        row_size = np.dtype(dtype).itemsize * (1 if width is None else width)
+        size = 0
+        if os.path.isfile(path) and row_size > 0:
+            file_size = os.path.getsize(path)
+            size = file_size // row_size
+            if file_size != (size if length is None else length) * row_size:
+                # only whole rows up to the length of the time column are
+                # read, the file is repaired on the next write
+                logger.warning(
+                    f"The report column {name} holds {file_size} bytes, "
+                    f"{size if length is None else length} rows of {row_size} bytes were expected"
+                )
+        if length is not None:
+            size = min(size, length)
+        shape = (size,) if width is None else (size, width)
+        column = np.empty(shape, dtype=dtype)
+        if size > 0:
+            column = np.memmap(path, dtype=dtype, mode="r", shape=shape)
+        if length is not None and size < length:
+            # the column is shorter than the time column if a write was interrupted
+            padding = np.full((length - size,) + shape[1:], np.nan, dtype)
+            column = np.concatenate((column, padding))
+        return column
+
+    def _check_column(self, name, column, force=False):
+        """
+        Rewrite the file of the column if it does not match the column in memory
+        """
+        path = self._column_path(name)
+        if force or not os.path.isfile(path) or os.path.getsize(path) != column.nbytes:
+            # replace the file instead of truncating it : the column may be a
+            # memmap of this file
+            np.ascontiguousarray(column).tofile(path + ".tmp")
+            os.replace(path + ".tmp", path)
+
+    def _write_column(self, name, column, values):
+        self._check_column(name, column)
+        with open(self._column_path(name), "ab") as f:
+            f.write(values.tobytes())
+        return np.concatenate((column, values))
+
+    def _read_symbols(self, group):
+        if not os.path.isfile(self._symbols_path(group)):
+            return []
+        with open(self._symbols_path(group)) as f:
+            return json.load(f)
+
+    def _write_matrix(self, group, reports):
+        # the columns on disk are the reference : a failed write may have
+        # added symbols that this store does not know about
+        disk_symbols = self._read_symbols(group)
+        matrix = getattr(self, group)
+        if matrix.symbols != disk_symbols[: len(matrix.symbol_index)]:
+            raise RuntimeError(
+                f"The {group} of the report store do not match the ones on disk"
+            )
+        matrix, _ = matrix.with_symbols(disk_symbols)
+        matrix, new_symbols = matrix.with_symbols(
+            sorted(set().union(*(r.get(group, {}) for r in reports)))
+        )
+        name = self._matrix_name(group, len(matrix.symbol_index))
+        # a file with the new width may be left over from an interrupted
+        # write, with other symbols : always rewrite it
+        self._check_column(name, matrix.values, force=len(new_symbols) > 0)
+        if len(new_symbols) > 0:
+            # the matrix with the new width is complete on disk before the
+            # json file refers to it, the previous one is removed afterwards
+            with open(self._symbols_path(group) + ".tmp", "w") as f:
+                json.dump(matrix.symbols, f)
+            os.replace(self._symbols_path(group) + ".tmp", self._symbols_path(group))
+            for filename in os.listdir(self.path):
+                if filename.startswith(group + ".") and filename.endswith(".bin"):
+                    if filename != name + ".bin":
+                        os.remove(os.path.join(self.path, filename))
+
+        rows = np.full((len(reports), len(matrix.symbol_index)), np.nan, matrix.dtype)
+        for i_report, report in enumerate(reports):
+            for symbol, value in report.get(group, {}).items():
+                rows[i_report, matrix.symbol_index[symbol]] = value
+        with open(self._column_path(name), "ab") as f:
+            f.write(rows.tobytes())
+        return matrix.with_rows(rows)
+
+    def load(self):
+        if not os.path.isdir(self.path):
+            return self
+        self.time = self._read_column("time", np.int64)
+        length = len(self.time)
+        self.total_usdt = self._read_column("total_usdt", np.float64, length)
+        for group, dtype in self.groups.items():
+            symbols = self._read_symbols(group)
+            values = self._read_column(
+                self._matrix_name(group, len(symbols)),
+                dtype,
+                length,
+                width=len(symbols),
+            )
+            setattr(self, group, SymbolMatrix(symbols, values, dtype=dtype))
+        return self
+
+    def extend(self, reports):
+        """
+        Write the reports at the end of the store, and return a new store
+        holding them. This store is left unchanged, as it may be read by
+        other threads in the meantime.
+        """
+        if len(reports) == 0:
+            return self
+        os.makedirs(self.path, exist_ok=True)
+        store = ReportStore(self.path)
+
+        total_usdt = np.array([r["total_usdt"] for r in reports], dtype=np.float64)
+        store.total_usdt = self._write_column("total_usdt", self.total_usdt, total_usdt)
+        for group in self.groups:
+            setattr(store, group, self._write_matrix(group, reports))
+
+        # the time column is written last : it defines the number of valid
+        # reports in the store if a write is interrupted
+        times = np.array([r["time"] for r in reports], dtype=np.int64)
+        store.time = self._write_column("time", self.time, times)
+        return store
+
+    def append(self, report):
+        return self.extend([report])
+
+    def last_modified(self):
+        """
+        Modification time of the time column, in ns, or None if the store is empty
+        """
+        try:
+            return os.stat(self._column_path("time")).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def start_index(self, min_timestamp):
+        """
+        Index of the first report more recent than `min_timestamp`
+        """
+        return int(np.searchsorted(self.time, min_timestamp, side="left"))
+
+
 def migrate_reports():
     """
-    Used to migrate report placement from v1.1.1 to v1.2
+    Used to migrate report placement from v1.1.1 to v1.2,
+    and the pickled reports to the columnar report store
     """
 
     if os.path.isfile("data/crypto.npy"):
-        shutil.move("data/crypto.npy", reports_path())
+        shutil.move("data/crypto.npy", legacy_reports_path())
+
+    if os.path.isfile(legacy_reports_path()) and not os.path.isdir(reports_path()):
+        logger.info("Migrating the reports to the columnar report store")
+        reports = np.load(legacy_reports_path(), allow_pickle=True).tolist()
+        # build the store aside and move it in place once it is complete, so
+        # that an interrupted migration is started over on the next launch
+        tmp_path = reports_path() + ".tmp"
+        if os.path.isdir(tmp_path):
+            shutil.rmtree(tmp_path)
+        os.makedirs(tmp_path)
+        ReportStore(tmp_path).extend(reports)
+        os.replace(tmp_path, reports_path())
+        shutil.move(legacy_reports_path(), legacy_reports_path() + ".bak")
 
 
 def build_ticker(all_symbols, tickers_raw):
@@ -68,12 +360,60 @@ def build_ticker(all_symbols, tickers_raw):
     return tickers
 
 
+def fx_cache_path():
+    return os.path.join(settings.ROOT_PATH, "data", "btbmt_fx_cache.json")
+
+
+def get_fx_rate(currency):
+    """
+    USD value of one unit of `currency`, from openexchangerates.
+    The rate is cached in memory and on disk for `fx_cache_ttl` seconds.
+    """
+    if _fx_cache["currency"] is None and os.path.isfile(fx_cache_path()):
+        try:
+            with open(fx_cache_path()) as f:
+                _fx_cache.update(json.load(f))
+        except Exception as e:
+            logger.debug(f"Cannot read the FX rate cache : {e}")
+
+    if (
+        _fx_cache["currency"] == currency
+        and time.time() - _fx_cache["time"] < fx_cache_ttl
+    ):
+        return _fx_cache["rate"]
+
+    response = _oer_session.get(
+        "https://openexchangerates.org/api/latest.json?app_id=" + settings.OER_KEY
+    )
+    rate = 1 / response.json()["rates"][currency]
+    _fx_cache.update(time=time.time(), rate=rate, currency=currency)
+    try:
+        with open(fx_cache_path(), "w") as f:
+            json.dump(_fx_cache, f)
+    except Exception as e:
+        logger.debug(f"Cannot write the FX rate cache : {e}")
+    return rate
+
+
 def get_report():
+    import binance
+
     api = binance.Client(
         settings.BINANCE_API_KEY, settings.BINANCE_API_SECRET, tld=settings.TLD
     )
 
-    account = api.get_account()
+    # the requests are independent, run them concurrently
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        account_future = executor.submit(api.get_account)
+        tickers_raw_future = executor.submit(api.get_symbol_ticker)
+        fx_rate_future = None
+        if settings.CURRENCY not in ("USD", "EUR"):
+            fx_rate_future = executor.submit(get_fx_rate, settings.CURRENCY)
+
+        account = account_future.result()
+        tickers_raw = tickers_raw_future.result()
+        fx_rate = fx_rate_future.result() if fx_rate_future is not None else None
+
     account_symbols = []
     balances = {}
     for balance in account["balances"]:
@@ -95,26 +435,29 @@ def get_report():
     all_symbols = list(set(settings.COIN_LIST + account_symbols + additional_coins))
     if settings.CURRENCY == "EUR":
         all_symbols.append("EUR")
-    tickers_raw = api.get_symbol_ticker()
     tickers = build_ticker(all_symbols, tickers_raw)
-    if settings.CURRENCY not in ("USD", "EUR"):
-        ticker = (
-            1
-            / requests.get(
-                "https://openexchangerates.org/api/latest.json?app_id="
-                + settings.OER_KEY
-            ).json()["rates"][settings.CURRENCY]
-        )
-        tickers[settings.CURRENCY] = ticker
+    if fx_rate is not None:
+        tickers[settings.CURRENCY] = fx_rate
 
     logger.debug(f"Prices after filtering : {tickers}")
 
-    total_usdt = 0
+    priced_symbols = []
     for symbol in account_symbols:
         if symbol not in tickers:
             logger.debug(f"{symbol} has no price, skipping")
             continue
-        total_usdt += balances[symbol] * tickers[symbol]
+        priced_symbols.append(symbol)
+    quantities = np.fromiter(
+        (balances[s] for s in priced_symbols),
+        dtype=np.float64,
+        count=len(priced_symbols),
+    )
+    prices = np.fromiter(
+        (tickers[s] for s in priced_symbols),
+        dtype=np.float64,
+        count=len(priced_symbols),
+    )
+    total_usdt = float(np.vdot(quantities, prices))
 
     report = {}
     report["total_usdt"] = total_usdt
@@ -124,18 +467,27 @@ def get_report():
 
 
 def get_previous_reports():
-    if os.path.exists(reports_path()):
-        reports = np.load(reports_path(), allow_pickle=True).tolist()
-        return reports
-    else:
-        return []
+    store = ReportStore(reports_path())
+    mtime = store.last_modified()
+    if _reports_cache["reports"] is None or _reports_cache["mtime"] != mtime:
+        _reports_cache["reports"] = store.load()
+        _reports_cache["mtime"] = mtime
+    return _reports_cache["reports"]
 
 
 def save_report(report, old_reports):
     report["time"] = int(time.time())
-    old_reports.append(report)
-    np.save(reports_path(), old_reports, allow_pickle=True)
-    return old_reports
+    try:
+        reports = old_reports.append(report)
+    except Exception:
+        # the files may have been partially written, reload them next time
+        _reports_cache["reports"] = None
+        raise
+    # the new store is already up to date, no need to reload it. old_reports
+    # is left unchanged : handlers reading it in the meantime are unaffected
+    _reports_cache["reports"] = reports
+    _reports_cache["mtime"] = reports.last_modified()
+    return reports
 
 
 def make_snapshot():
@@ -145,6 +497,25 @@ def make_snapshot():
     logger.info("Snapshot saved")
 
 
+def get_figure(large):
+    """
+    Cleared figure and axes of the graphs, created once per size with an Agg
+    canvas (no pyplot) and reused across calls. Callers must hold
+    `_figures_lock` while using them. matplotlib is only imported for the
+    first graph, to keep it out of the startup of the bot.
+    """
+    if large not in _figures:
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        fig = Figure(figsize=(10, 6)) if large else Figure()
+        FigureCanvasAgg(fig)
+        _figures[large] = (fig, fig.add_subplot(1, 1, 1))
+    else:
+        _figures[large][1].cla()
+    return _figures[large]
+
+
 def get_graph(relative, symbols, days, graph_type, ref_currency):
     if symbols == ["*"]:
         symbols = settings.COIN_LIST
@@ -155,78 +526,89 @@ def get_graph(relative, symbols, days, graph_type, ref_currency):
         relative = True
     reports = get_previous_reports()
 
-    plt.clf()
-    plt.close()
-    if len(symbols) < 10:
-        plt.figure()
-    else:
-        plt.figure(figsize=(10, 6))
+    import dateutil.tz
+    import matplotlib
+    import matplotlib.dates as mdates
+    from matplotlib.collections import LineCollection
+    from matplotlib.lines import Line2D
 
     min_timestamp = 0
     if days != 0:
         min_timestamp = time.time() - days * 24 * 60 * 60
+    start = reports.start_index(min_timestamp)
+    times = reports.time[start:]
+    total_usdt = reports.total_usdt[start:]
+
+    ref_tickers = np.ones(len(times))
+    if ref_currency not in ("USD", "USDT"):
+        ref_tickers = reports.tickers.get(ref_currency, np.full(len(reports), np.nan))
+        ref_tickers = ref_tickers[start:]
 
     nb_plot = 0
+    segments, labels = [], []
     for symbol in symbols:
-        X, Y = [], []
-        for report in reports:
-            if report["time"] < min_timestamp:
-                continue  # skip if too recent
-            if symbol not in report["tickers"]:
-                ts = report["time"]
-                logger.debug(f"{symbol} has no price in the report with timestamp {ts}")
-                continue
-            ticker = report["tickers"][symbol]
-            if ticker == 0:
-                ts = report["time"]
-                logger.debug(
-                    f"{symbol} has an invalid price in the report with timestamp {ts}"
-                )
-                continue
-
-            y = None
-            if graph_type == "amount":
-                y = report["total_usdt"] / ticker
-            elif graph_type == "price":
-                ref_currency_ticker = 1
-                if ref_currency not in ("USD", "USDT"):
-                    if ref_currency not in report["tickers"]:
-                        continue
-                    ref_currency_ticker = report["tickers"][ref_currency]
-                    if ref_currency_ticker == 0:
-                        continue
-                y = ticker / ref_currency_ticker
-            if y is None:
-                continue
-
-            Y.append(y)
-            X.append(dt.datetime.fromtimestamp(report["time"]))
-            nb_plot += 1
+        if symbol not in reports.tickers:
+            logger.debug(f"{symbol} has no price in the reports")
+            continue
+        tickers = reports.tickers[symbol][start:]
+        # missing prices are stored as NaN, which fails the comparison
+        valid = tickers > 0
+        if graph_type == "amount":
+            Y = total_usdt[valid] / tickers[valid]
+        elif graph_type == "price":
+            valid &= ref_tickers > 0
+            Y = tickers[valid] / ref_tickers[valid]
+        else:
+            continue
+        if len(Y) < len(valid):
+            logger.debug(
+                f"{symbol} has no valid price in {len(valid) - len(Y)} of the {len(valid)} reports"
+            )
 
         if len(Y) == 0:
             continue
+        nb_plot += len(Y)
 
         if relative:
-            Y = np.array(Y)
-            Y = (Y / Y[0] - 1) * 100
-        plt.plot(X, Y, label=symbol)
-
-    plt.gca().xaxis.set_major_formatter(mdates.DateFormatter("%d/%m %H:%M"))
-    plt.setp(plt.xticks()[1], rotation=15)
-    if graph_type == "amount":
-        if relative:
-            plt.ylabel(i18n.t("graph.relative_amount"))
-            plt.legend(bbox_to_anchor=(1, 1), loc="upper left")
-        else:
-            label = i18n.t("graph.amount")
-            label += f" ({symbols[0]})" if len(symbols) == 1 else ""
-            plt.ylabel(label)
-    elif graph_type == "price":
-        if relative:
-            plt.ylabel(i18n.t("graph.relative_price", currency=ref_currency))
-        else:
-            plt.ylabel(i18n.t("graph.price", currency=ref_currency))
-    plt.grid()
-    figname = f"data/quantity_{symbol}.png"
-    plt.savefig(figname)
-    return figname, nb_plot
+            # Y is a new array, it can be modified in place
+            Y /= Y[0]
+            Y -= 1
+            Y *= 100
+        X = mdates.date2num(times[valid].astype("datetime64[s]"))
+        segments.append(np.column_stack((X, Y)))
+        labels.append(symbol)
+
+    with _figures_lock:
+        fig, ax = get_figure(large=len(symbols) >= 10)
+
+        # the timestamps are converted in UTC, show them in local time
+        local_tz = dateutil.tz.tzlocal()
+        ax.xaxis_date(local_tz)
+        ax.xaxis.set_major_formatter(mdates.DateFormatter("%d/%m %H:%M", tz=local_tz))
+        ax.tick_params(axis="x", labelrotation=15)
+
+        # draw all the series as a single artist
+        cycle_colors = matplotlib.rcParams["axes.prop_cycle"].by_key()["color"]
+        colors = [cycle_colors[i % len(cycle_colors)] for i in range(len(segments))]
+        ax.add_collection(LineCollection(segments, colors=colors))
+        ax.autoscale_view()
+
+        if graph_type == "amount":
+            if relative:
+                ax.set_ylabel(i18n.t("graph.relative_amount"))
+                handles = [Line2D([], [], color=color) for color in colors]
+                ax.legend(handles, labels, bbox_to_anchor=(1, 1), loc="upper left")
+            else:
+                label = i18n.t("graph.amount")
+                label += f" ({symbols[0]})" if len(symbols) == 1 else ""
+                ax.set_ylabel(label)
+        elif graph_type == "price":
+            if relative:
+                ax.set_ylabel(i18n.t("graph.relative_price", currency=ref_currency))
+            else:
+                ax.set_ylabel(i18n.t("graph.price", currency=ref_currency))
+        ax.grid(True)
+        figure = io.BytesIO()
+        fig.savefig(figure, format="png", bbox_inches="tight")
+        figure.seek(0)
+    return figure, nb_plot
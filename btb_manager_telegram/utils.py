@@ -4,6 +4,8 @@ import json
 import os
 import sqlite3
 import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import i18n
 import psutil
@@ -14,6 +16,18 @@ from btb_manager_telegram.formating import escape_tg
 from btb_manager_telegram.logging import logger
 from btb_manager_telegram.schedule import scheduler
 
+try:
+    # use the libyaml bindings when they are available
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:
+    from yaml import SafeLoader as YamlLoader
+
+_binance_trade_bot_process = None
+
+update_check_ttl = dt.timedelta(minutes=10).total_seconds()
+
+_custom_scripts_cache = {"mtime": None, "result": None}
+
 
 def setup_i18n(lang):
     i18n.set("locale", lang)
@@ -72,7 +86,7 @@ def setup_telegram_constants():
     if os.path.exists(yaml_file_path):
         with open(yaml_file_path) as f:
             try:
-                parsed_urls = yaml.load(f, Loader=yaml.FullLoader)["urls"]
+                parsed_urls = yaml.load(f, Loader=YamlLoader)["urls"]
             except Exception as e:
                 logger.error(
                     "Unable to correctly read apprise.yml file. Make sure it is correctly set up."
@@ -132,22 +146,38 @@ def setup_coin_list():
 
 
 def get_binance_trade_bot_process():
+    global _binance_trade_bot_process
     name = "binance_trade_bot"
     is_root_path_absolute = os.path.isabs(settings.ROOT_PATH)
     bot_path = os.path.normpath(settings.ROOT_PATH)
     if not is_root_path_absolute:
         bot_path = os.path.normpath(os.path.join(os.getcwd(), settings.ROOT_PATH))
 
-    for proc in psutil.process_iter():
+    # is_running also checks the creation time, so a reused pid is not mistaken
+    # for the process found previously
+    if _binance_trade_bot_process is not None:
         try:
             if (
-                name in proc.name() or name in " ".join(proc.cmdline())
-            ) and proc.cwd() == bot_path:
-                return proc
-        except psutil.AccessDenied:
-            continue
-        except psutil.ZombieProcess:
-            continue
+                _binance_trade_bot_process.is_running()
+                and _binance_trade_bot_process.cwd() == bot_path
+            ):
+                return _binance_trade_bot_process
+        except psutil.Error:
+            pass
+        _binance_trade_bot_process = None
+
+    # process_iter retreives the attributes in one go and sets them
+    # to None when access is denied. cwd is only read for the processes
+    # matching the name, as it is the most expensive one.
+    for proc in psutil.process_iter(attrs=["name", "cmdline"]):
+        info = proc.info
+        if name in (info["name"] or "") or name in " ".join(info["cmdline"] or []):
+            try:
+                if proc.cwd() == bot_path:
+                    _binance_trade_bot_process = proc
+                    return proc
+            except psutil.Error:
+                continue
 
 
 def find_and_kill_binance_trade_bot_process():
@@ -169,20 +199,50 @@ def kill_btb_manager_telegram_process():
         logger.info(f"ERROR: {e}")
 
 
+def cache_update_check(fun):
+    """
+    Cache the result of an update check for `update_check_ttl` seconds.
+    Failed checks (exception raised or None returned) are not cached.
+    """
+    cache = {}
+
+    def _f_cache_update_check():
+        if "result" in cache and time.time() - cache["time"] < update_check_ttl:
+            return cache["result"]
+        result = fun()
+        if result is not None:
+            cache["result"] = result
+            cache["time"] = time.time()
+        return result
+
+    _f_cache_update_check.cache_clear = cache.clear
+    return _f_cache_update_check
+
+
+@cache_update_check
 def is_btb_bot_update_available():
     try:
-        proc = subprocess.Popen(
-            ["bash", "-c", "git remote update origin && git status -uno"],
-            stdout=subprocess.PIPE,
+        subprocess.run(
+            ["git", "remote", "update", "origin"],
+            cwd=settings.ROOT_PATH,
+            capture_output=True,
+            check=True,
+        )
+        result = subprocess.run(
+            ["git", "rev-list", "--left-right", "--count", "HEAD...@{upstream}"],
+            cwd=settings.ROOT_PATH,
+            capture_output=True,
+            check=True,
         )
-        output, _ = proc.communicate()
-        re = "Your branch is behind" in str(output)
+        nb_ahead, nb_behind = map(int, result.stdout.decode().split())
+        re = nb_ahead == 0 and nb_behind > 0
     except Exception as e:
         logger.error(e, exc_info=True)
         re = None
     return re
 
 
+@cache_update_check
 def is_tg_bot_update_available():
     result = subprocess.run(["git", "remote", "update", "origin"], capture_output=True)
     if result.returncode != 0:
@@ -209,26 +269,35 @@ def is_tg_bot_update_available():
 def update_checker():
     logger.info("Checking for updates.")
 
-    if settings.TG_UPDATE_BROADCASTED_BEFORE is False:
-        to_update, cur_vers, rem_vers = is_tg_bot_update_available()
-        if to_update:
-            logger.info(
-                f"BTB Manager Telegram update found. ({cur_vers} -> {rem_vers})"
-            )
-            message = f"{i18n.t('update.tgb.available', current_version=cur_vers, remote_version=rem_vers)}\n\n{i18n.t('update.tgb.instruction')}"
-            print(message)
-            settings.TG_UPDATE_BROADCASTED_BEFORE = True
-            settings.CHAT.send_message(escape_tg(message), parse_mode="MarkdownV2")
-
-    if settings.BTB_UPDATE_BROADCASTED_BEFORE is False:
-        if is_btb_bot_update_available():
-            logger.info("Binance Trade Bot update found.")
-            message = (
-                f"{i18n.t('update.btb.available')}\n\n"
-                f"{i18n.t('update.btb.instruction')}"
-            )
-            settings.BTB_UPDATE_BROADCASTED_BEFORE = True
-            settings.CHAT.send_message(escape_tg(message), parse_mode="MarkdownV2")
+    # both checks wait on the network, run them concurrently
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        tg_update_future = None
+        btb_update_future = None
+        if settings.TG_UPDATE_BROADCASTED_BEFORE is False:
+            tg_update_future = executor.submit(is_tg_bot_update_available)
+        if settings.BTB_UPDATE_BROADCASTED_BEFORE is False:
+            btb_update_future = executor.submit(is_btb_bot_update_available)
+
+        if tg_update_future is not None:
+            to_update, cur_vers, rem_vers = tg_update_future.result()
+            if to_update:
+                logger.info(
+                    f"BTB Manager Telegram update found. ({cur_vers} -> {rem_vers})"
+                )
+                message = f"{i18n.t('update.tgb.available', current_version=cur_vers, remote_version=rem_vers)}\n\n{i18n.t('update.tgb.instruction')}"
+                print(message)
+                settings.TG_UPDATE_BROADCASTED_BEFORE = True
+                settings.CHAT.send_message(escape_tg(message), parse_mode="MarkdownV2")
+
+        if btb_update_future is not None:
+            if btb_update_future.result():
+                logger.info("Binance Trade Bot update found.")
+                message = (
+                    f"{i18n.t('update.btb.available')}\n\n"
+                    f"{i18n.t('update.btb.instruction')}"
+                )
+                settings.BTB_UPDATE_BROADCASTED_BEFORE = True
+                settings.CHAT.send_message(escape_tg(message), parse_mode="MarkdownV2")
 
 
 def get_custom_scripts_keyboard():
@@ -239,7 +308,16 @@ def get_custom_scripts_keyboard():
     custom_script_exist = False
     message = i18n.t("script.no_script")
 
-    if os.path.exists(custom_scripts_path):
+    try:
+        mtime = os.stat(custom_scripts_path).st_mtime_ns
+    except FileNotFoundError:
+        mtime = None
+
+    if mtime is not None and _custom_scripts_cache["mtime"] == mtime:
+        keyboard, custom_script_exist, message = _custom_scripts_cache["result"]
+        return list(keyboard), custom_script_exist, message
+
+    if mtime is not None:
         with open(custom_scripts_path) as f:
             scripts = json.load(f)
             for script_name in scripts:
@@ -255,7 +333,10 @@ def get_custom_scripts_keyboard():
         message = i18n.t("script.no_config")
 
     keyboard.append([i18n.t("keyboard.cancel")])
-    return keyboard, custom_script_exist, message
+    if mtime is not None:
+        _custom_scripts_cache["mtime"] = mtime
+        _custom_scripts_cache["result"] = (keyboard, custom_script_exist, message)
+    return list(keyboard), custom_script_exist, message
 
 
 def get_restart_file_name(old_pid):